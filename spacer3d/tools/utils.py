@@ -5,6 +5,7 @@ import torch
 import albumentations as A
 from albumentations.pytorch import ToTensorV2
 from torch.utils.data import Dataset, DataLoader
+from torch.utils.data.distributed import DistributedSampler
 from abc import ABC, abstractmethod
 from tqdm import tqdm
 from glob import glob
@@ -46,6 +47,42 @@ def dice_coef_multiclass(y_true, y_pred, n_classes=80):
 def pixelwise_accuracy(y, y_pred):
     return (y_pred == y).sum() / y.shape[1]
 
+class CachedDataset(Dataset):
+    """
+    Wraps a dataset whose transform is deterministic (e.g. resize and
+    normalize only) and keeps every sample in memory after it is first
+    loaded, so later epochs skip disk reads, decoding and transforms.
+    Floating point tensors are cached as float16 and restored to float32
+    when served.
+
+    With num_workers > 0 every worker keeps its own cache of the samples it
+    loads, so this should be used with persistent workers and shuffle=False
+
+    Arguments:
+        - dataset (Dataset): dataset to cache
+    """
+    def __init__(self, dataset: Dataset):
+        self.dataset = dataset
+        self.cache = {}
+
+    def __len__(self) -> int:
+        return len(self.dataset)
+
+    def __getitem__(self, idx: int):
+        if idx not in self.cache:
+            sample = self.dataset[idx]
+            if not isinstance(sample, tuple):
+                sample = (sample,)
+            self.cache[idx] = tuple(
+                x.half() if torch.is_tensor(x) and x.is_floating_point() else x
+                for x in sample
+            )
+        sample = tuple(
+            x.float() if torch.is_tensor(x) and x.dtype == torch.float16 else x
+            for x in self.cache[idx]
+        )
+        return sample if len(sample) > 1 else sample[0]
+
 def get_CoNSeP_transforms(image_size: int) -> dict[str, A.Compose]:
     train_transform = A.Compose(
         [
@@ -227,7 +264,15 @@ def get_COCO_loaders(
     transforms: dict[str, A.Compose],
     image_ext: str = "jpg",
     mask_ext: str = "png",
+    distributed: bool = False,
+    cache_val: bool = True,
 ) -> tuple[DataLoader[object]]:
+    # Keep workers alive across epochs and their prefetch queues full.
+    # Both options are only valid when loading with worker processes.
+    worker_kwargs = (
+        {"persistent_workers": True, "prefetch_factor": 4}
+        if num_workers > 0 else {}
+    )
 
     train_ds = COCODataset(
         os.path.join(image_path, "train2017"),
@@ -236,12 +281,18 @@ def get_COCO_loaders(
         mask_ext=mask_ext,
         transform=transforms["train"],
     )
+    # Under DistributedDataParallel each rank loads its own shard of the
+    # training set; callers must call train_loader.sampler.set_epoch(epoch)
+    # so the shuffle differs between epochs
+    train_sampler = DistributedSampler(train_ds) if distributed else None
     train_loader = DataLoader(
         train_ds,
         batch_size=batch_size,
-        shuffle=True,
+        shuffle=train_sampler is None,
+        sampler=train_sampler,
         num_workers=num_workers,
         pin_memory=pin_memory,
+        **worker_kwargs,
     )
 
     val_ds = COCODataset(
@@ -251,12 +302,17 @@ def get_COCO_loaders(
         mask_ext=mask_ext,
         transform=transforms["val"],
     )
+    # val transform is deterministic, so samples can be decoded once and
+    # reused on every validation pass
+    if cache_val:
+        val_ds = CachedDataset(val_ds)
     val_loader = DataLoader(
         val_ds,
         batch_size=batch_size,
         shuffle=False,
         num_workers=num_workers,
         pin_memory=pin_memory,
+        **worker_kwargs,
     )
     return train_loader, val_loader
 